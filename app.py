@@ -1,41 +1,123 @@
 # app.py — Stylish web-based chatbot with memory and mode selection
+import atexit
+import html
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import gradio as gr
 from chat_core import ChatEngine
 
 from tts import speak
 from gtts import gTTS
 
+# Configure logging once for the whole app (modules only create named loggers);
+# third-party libraries stay at WARNING, our own engine logs at INFO
+logging.basicConfig(level=logging.WARNING, format="[%(levelname)s] %(name)s: %(message)s")
+logging.getLogger("chat_core").setLevel(logging.INFO)
+LOGGER = logging.getLogger("app")
 
-# Initialize chat engine
-ce = ChatEngine()
+# Maximum number of user/assistant turns kept per session
+MAX_TURNS = 40
 
-# Session memory: keeps track of conversation per user session
-session_history = []
+# Minimum seconds between UI updates while a reply is streaming (20 Hz)
+STREAM_INTERVAL = 0.05
 
-def chat_function(user_input, selected_mode):
-    # Append user input to memory
-    session_history.append({"role": "user", "content": user_input})
-    
-    # Get response from ChatEngine
-    reply = ce.respond(user_input, mode=selected_mode)
-    
-    # Append assistant reply to memory
-    session_history.append({"role": "assistant", "content": reply})
-    
-    # Format conversation history with chat bubbles
-    history_html = ""
-    for msg in session_history:
-        if msg["role"] == "user":
-            history_html += f"""
-            <div class='bubble user'>{msg['content']}</div>
-            """
-        else:
-            history_html += f"""
-            <div class='bubble bot'>{msg['content']}</div>
-            """
-    
-    # Return scrollable container
-    return f"<div class='chat-container'>{history_html}</div>"
+# Chat bubble templates, filled with pre-escaped message HTML
+USER_TMPL = "<div class='bubble user'>{}</div>"
+BOT_TMPL = "<div class='bubble bot'>{}</div>"
+
+# Background workers for voice output, so synthesis never delays the text reply
+_TTS_POOL = ThreadPoolExecutor(max_workers=2)
+
+# Voice output files live here; each session keeps only its latest one, and the
+# directory (with every session's last file) is removed when the app exits
+_TTS_DIR = tempfile.mkdtemp(prefix="chatbot-tts-")
+atexit.register(shutil.rmtree, _TTS_DIR, ignore_errors=True)
+
+def new_session():
+    """Create per-session state: a private chat engine and rendered bubbles (oldest turns drop off)."""
+    return {
+        "engine": ChatEngine(),
+        "bubbles": deque(maxlen=MAX_TURNS),
+    }
+
+def make_message(role, content):
+    """Build a message for rendering: role plus HTML, escaped once here rather than per render."""
+    return {"role": role, "html": html.escape(content).replace("\n", "<br>")}
+
+def render_bubble(msg):
+    return (USER_TMPL if msg["role"] == "user" else BOT_TMPL).format(msg["html"])
+
+def _synth_mp3(text):
+    """Synthesize text with gTTS into an MP3 file under _TTS_DIR and return its path."""
+    fd, path = tempfile.mkstemp(suffix=".mp3", dir=_TTS_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            gTTS(text).write_to_fp(f)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+def _discard_file(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+def tts_function(session):
+    # Wait for the synthesis started by chat_function (runs after the text is shown)
+    future = session.pop("tts", None)
+    if future is None:
+        return None
+    try:
+        path = future.result()
+    except Exception as e:
+        LOGGER.warning("Voice output failed: %s", e)
+        return None
+
+    # Replace this session's previous audio file (Gradio serves its own copy)
+    previous = session.get("tts_file")
+    if previous:
+        _discard_file(previous)
+    session["tts_file"] = path
+    return path
+
+def chat_function(user_input, selected_mode, session, tts_enabled=False):
+    user_msg = make_message("user", user_input)
+    user_bubble = render_bubble(user_msg)
+
+    # Everything above the reply bubble is fixed for this turn
+    prefix = "<div class='chat-container'>" + "".join(session["bubbles"]) + user_bubble
+    yield prefix + "</div>", session
+
+    # Stream the reply, coalescing UI updates to at most one per STREAM_INTERVAL
+    pending = []
+    last_emit = time.monotonic()
+    for delta in session["engine"].respond_stream(user_input, mode=selected_mode):
+        pending.append(delta)
+        now = time.monotonic()
+        if now - last_emit > STREAM_INTERVAL:
+            last_emit = now
+            partial = make_message("assistant", "".join(pending))
+            yield prefix + render_bubble(partial) + "</div>", session
+    reply = "".join(pending).strip()
+
+    # Cache the rendered turn (the engine keeps the model-side history)
+    bot_bubble = render_bubble(make_message("assistant", reply))
+    session["bubbles"].append(user_bubble + bot_bubble)
+
+    # Start voice output in the background; tts_function picks up the result
+    if tts_enabled and reply:
+        session["tts"] = _TTS_POOL.submit(_synth_mp3, reply)
+
+    # Return scrollable container and the updated session
+    yield prefix + bot_bubble + "</div>", session
 
 with gr.Blocks() as demo:
     # Title
@@ -53,8 +135,16 @@ with gr.Blocks() as demo:
     # HTML container for chat history
     chatbot_output = gr.HTML("<div id='chatbox'></div>", elem_id="chatbox")
 
-    # Submit event
-    user_input.submit(chat_function, [user_input, mode_selector, tts_toggle], chatbot_output)
+    # Audio player for voice output
+    audio_output = gr.Audio(label="Voice Output", autoplay=True)
+
+    # Per-session memory (one per browser connection)
+    session_state = gr.State(new_session)
+
+    # Submit event: show the text reply first, then attach audio once synthesized
+    user_input.submit(
+        chat_function, [user_input, mode_selector, session_state, tts_toggle], [chatbot_output, session_state]
+    ).then(tts_function, session_state, audio_output)
 
 
 # Custom CSS styling
@@ -147,10 +237,16 @@ with gr.Blocks(css=css) as demo:
     
     mode_selector = gr.Dropdown(["chat", "code", "knowledge"], label="Select Mode", value="chat")
     user_input = gr.Textbox(label="Your Message", placeholder="Type your question here...")
+    tts_toggle = gr.Checkbox(label="Enable Voice Output (TTS)", value=False)
     chatbot_output = gr.HTML("<div id='chatbox'></div>", elem_id="chatbox")
+    audio_output = gr.Audio(label="Voice Output", autoplay=True)
+    session_state = gr.State(new_session)
     
-    user_input.submit(chat_function, [user_input, mode_selector], chatbot_output)
+    user_input.submit(
+        chat_function, [user_input, mode_selector, session_state, tts_toggle], [chatbot_output, session_state]
+    ).then(tts_function, session_state, audio_output)
 
+demo.queue()
 demo.launch()
 with gr.Blocks(css="""
 /* Header styling */
@@ -3,6 +3,7 @@ chat_core.py — Core Chat Engine with memory and modes
 
 Features:
 - Per-session chat history (in-memory buffer with auto-trimming)
+- Older turns folded into a running summary to keep prompts short
 - Modes: "chat", "code", "knowledge"
 - Uses OpenAI Chat Completions API (via openai>=1.0 Python SDK)
 - Optional Wikipedia enrichment in knowledge mode
@@ -21,35 +22,41 @@ Example Usage:
     ce = ChatEngine()
     reply = ce.respond("Hello!", mode="chat")
     print(reply)
+
+    # Or stream the reply as it is generated
+    for delta in ce.respond_stream("Tell me a joke.", mode="chat"):
+        print(delta, end="", flush=True)
 """
 
 from __future__ import annotations
 import os
+import hashlib
 import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional
+from importlib.util import find_spec
+from itertools import islice
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Deque, Iterator, List, Dict, Mapping, Optional
 
 # --------------------------- Optional Imports ---------------------------
-try:
+# openai and wikipedia are heavy; only check availability here and import on first use
+if TYPE_CHECKING:
     from openai import OpenAI  # OpenAI SDK v1.x
-    _HAS_OPENAI = True
-except Exception:
-    _HAS_OPENAI = False
+
+_HAS_OPENAI = find_spec("openai") is not None
 
 try:
     from knowledge import get_summary as wiki_summary  # lightweight import
-    _HAS_WIKI = True
+    _HAS_WIKI = find_spec("wikipedia") is not None
 except Exception:
     _HAS_WIKI = False
 
 # --------------------------- Logging -----------------------------------
+# Handlers and format are configured once by the entry point (app.py or __main__ below)
 LOGGER = logging.getLogger("chat_core")
-if not LOGGER.handlers:
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter("[%(levelname)s] %(name)s: %(message)s")
-    handler.setFormatter(formatter)
-    LOGGER.addHandler(handler)
-LOGGER.setLevel(logging.INFO)
 
 # --------------------------- System Prompts -----------------------------
 DEFAULT_SYSTEM_PROMPTS: Dict[str, str] = {
@@ -69,9 +76,69 @@ DEFAULT_SYSTEM_PROMPTS: Dict[str, str] = {
     ),
 }
 
+# Accepted mode names (after strip/lower) mapped to their canonical mode
+_MODE_MAP: Dict[str, str] = {
+    "chat": "chat",
+    "code": "code",
+    "code helper": "code",
+    "programming": "code",
+    "knowledge": "knowledge",
+    "facts": "knowledge",
+    "knowledge assistant": "knowledge",
+}
+
+# Low-signal inputs that never warrant a Wikipedia lookup
+_GREETINGS = frozenset({
+    "hi", "hello", "hey", "yo", "thanks", "thank you", "thx", "ok", "okay",
+    "cool", "nice", "great", "yes", "no", "sure", "bye", "goodbye",
+    "good morning", "good night",
+})
+
+# History stores roles as small ints; dicts are only built when a payload is needed
+_ROLE_NAMES = ("user", "assistant")
+_ROLE_CODES: Dict[str, int] = {name: code for code, name in enumerate(_ROLE_NAMES)}
+_USER = _ROLE_CODES["user"]
+
 # Safe default model; override via environment or constructor
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
 
+# Prompt used to fold older turns into a running conversation summary
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in at most 120 tokens. Keep names, "
+    "facts, decisions, and open questions; drop pleasantries."
+)
+
+# --------------------------- Shared Client -----------------------------
+# One OpenAI client (and its HTTP connection pool) shared by every ChatEngine
+_OPENAI_CLIENT: Optional["OpenAI"] = None
+_OPENAI_CLIENT_LOCK = threading.Lock()
+
+
+def _get_client() -> Optional["OpenAI"]:
+    """Return the shared OpenAI client, creating it on first use (None if unavailable)."""
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is None and _HAS_OPENAI:
+        with _OPENAI_CLIENT_LOCK:
+            if _OPENAI_CLIENT is None:
+                try:
+                    from openai import OpenAI
+                    _OPENAI_CLIENT = OpenAI()
+                    LOGGER.info("OpenAI client initialized")
+                except Exception as e:
+                    LOGGER.warning("Failed to initialize OpenAI client: %s", e)
+    return _OPENAI_CLIENT
+
+# Background workers that fold old turns into summaries off the reply path
+_SUMMARY_POOL = ThreadPoolExecutor(max_workers=2)
+
+def _prompt_cache_key(system_prompt: str, summary: str) -> str:
+    """Hash the stable head of the prompt so requests sharing it hit OpenAI's prompt cache."""
+    h = hashlib.blake2b(digest_size=8)
+    h.update(system_prompt.encode("utf-8"))
+    h.update(b"\0")
+    h.update(summary.encode("utf-8"))
+    return h.hexdigest()
+
 # --------------------------- Chat Engine -------------------------------
 @dataclass
 class ChatEngine:
@@ -79,49 +146,82 @@ class ChatEngine:
 
     model: str = DEFAULT_MODEL
     memory_size: int = 40
-    system_prompts: Dict[str, str] = field(default_factory=lambda: DEFAULT_SYSTEM_PROMPTS.copy())
+    # Read-only shared defaults until set_system_prompt copies them into a dict
+    system_prompts: Mapping[str, str] = field(
+        default_factory=lambda: MappingProxyType(DEFAULT_SYSTEM_PROMPTS)
+    )
     enable_wiki_in_knowledge_mode: bool = True
+    summary_window: int = 8  # recent messages kept verbatim; 0 disables summarization
+    summary_model: str = DEFAULT_MODEL
 
     # Internal state
-    _messages: List[Dict[str, str]] = field(default_factory=list, init=False)
+    _roles: Deque[int] = field(default_factory=deque, init=False)
+    _contents: Deque[str] = field(default_factory=deque, init=False)
+    _summary: str = field(default="", init=False)
+    _sys_msg_cache: Dict[str, Dict[str, str]] = field(default_factory=dict, init=False)
+    _pending_summary: Optional["Future[str]"] = field(default=None, init=False)
+    _pending_fold: int = field(default=0, init=False)
+    _llm_ok: bool = field(default=False, init=False)
     _client: Optional["OpenAI"] = field(default=None, init=False)
 
     def __post_init__(self) -> None:
-        if _HAS_OPENAI:
-            try:
-                self._client = OpenAI()
-                LOGGER.info("OpenAI client initialized with model '%s'", self.model)
-            except Exception as e:
-                LOGGER.warning("Failed to initialize OpenAI client: %s", e)
-        else:
+        # Parallel bounded ring buffers: appending past memory_size evicts the oldest message
+        self._roles = deque(maxlen=self.memory_size)
+        self._contents = deque(maxlen=self.memory_size)
+        # The OpenAI client (and the SDK import) is deferred to the first model call
+        if not _HAS_OPENAI:
             LOGGER.warning("openai package not available — ChatEngine will not call API.")
 
     # ----------------------- Public API -------------------------------
     def reset(self) -> None:
         """Clear chat history."""
-        self._messages.clear()
+        self._roles.clear()
+        self._contents.clear()
+        self._summary = ""
+        self._pending_summary = None
         LOGGER.info("Chat history reset.")
 
     def get_history(self) -> List[Dict[str, str]]:
         """Return current chat history."""
-        return list(self._messages)
+        return list(self._iter_messages())
+
+    def get_last_user_message(self) -> str:
+        """Return the most recent user message, scanning history from the newest end."""
+        return next((c for r, c in zip(reversed(self._roles), reversed(self._contents)) if r == _USER), "")
 
     def set_system_prompt(self, mode: str, prompt: str) -> None:
         """Set or override system prompt for a given mode."""
-        self.system_prompts[mode] = prompt
+        prompts = self.system_prompts
+        if isinstance(prompts, dict):
+            prompts[mode] = prompt
+        else:
+            # Copy-on-write: the shared read-only defaults are never mutated
+            self.system_prompts = {**prompts, mode: prompt}
+        self._sys_msg_cache.pop(mode, None)
         LOGGER.info("System prompt updated for mode '%s'", mode)
 
     def respond(self, user_input: str, mode: str = "chat") -> str:
         """Generate a reply for given user input and mode."""
+        return "".join(self.respond_stream(user_input, mode=mode)).strip()
+
+    def respond_stream(self, user_input: str, mode: str = "chat") -> Iterator[str]:
+        """Generate a reply for given user input and mode, yielding text deltas as they arrive.
+
+        The full reply is saved to history once the stream is exhausted.
+        """
         mode_key = self._normalize_mode(mode)
-        system_prompt = self.system_prompts.get(mode_key, DEFAULT_SYSTEM_PROMPTS["chat"])
+        sys_msg = self._system_message(mode_key)
+
+        # Apply the summary started after an earlier turn, if it has finished
+        self._apply_pending_summary()
 
         # Save user message
-        self._append_message({"role": "user", "content": user_input})
+        self._append_message("user", user_input)
 
         # Optional: Wikipedia enrichment
         tool_context = None
-        if mode_key == "knowledge" and self.enable_wiki_in_knowledge_mode and _HAS_WIKI:
+        if (mode_key == "knowledge" and self.enable_wiki_in_knowledge_mode and _HAS_WIKI
+                and self._needs_wiki(user_input)):
             try:
                 summary = wiki_summary(user_input, sentences=4)
                 if summary.strip():
@@ -131,36 +231,125 @@ class ChatEngine:
                 LOGGER.warning("Wikipedia enrichment failed: %s", e)
 
         # Build final messages
-        messages = self._build_model_messages(system_prompt, tool_context)
+        messages = self._build_model_messages(sys_msg, tool_context)
+        cache_key = _prompt_cache_key(sys_msg["content"], self._summary)
 
-        # Call model
-        reply_text = self._call_llm(messages)
+        # Call model, passing each delta through as it arrives
+        parts: List[str] = []
+        for delta in self._call_llm(messages, cache_key):
+            parts.append(delta)
+            yield delta
+        reply_text = "".join(parts).strip()
 
         # Save assistant reply
-        self._append_message({"role": "assistant", "content": reply_text})
-        return reply_text
+        self._append_message("assistant", reply_text)
+
+        # Summarize in the background so the caller is not kept waiting
+        if self._llm_ok:
+            self._maybe_summarize()
 
     # ----------------------- Internal Helpers -------------------------
+    def _ensure_client(self) -> Optional["OpenAI"]:
+        """Attach the shared OpenAI client on first use (None if unavailable)."""
+        if self._client is None and _HAS_OPENAI:
+            self._client = _get_client()
+            if self._client is not None:
+                LOGGER.info("ChatEngine using model '%s'", self.model)
+        return self._client
+
     def _normalize_mode(self, mode: str) -> str:
-        m = (mode or "").strip().lower()
-        if m in {"chat"}:
-            return "chat"
-        if m in {"code", "code helper", "programming"}:
-            return "code"
-        if m in {"knowledge", "facts", "knowledge assistant"}:
-            return "knowledge"
-        return "chat"
-
-    def _append_message(self, msg: Dict[str, str]) -> None:
-        """Append message to history with memory trimming."""
-        self._messages.append(msg)
-        overflow = max(0, len(self._messages) - self.memory_size)
-        if overflow:
-            del self._messages[:overflow]
-            LOGGER.debug("Trimmed history by %d messages", overflow)
-
-    def _build_model_messages(self, system_prompt: str, tool_context: Optional[str]) -> List[Dict[str, str]]:
-        msgs: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        return _MODE_MAP.get((mode or "").strip().lower(), "chat")
+
+    def _system_message(self, mode_key: str) -> Dict[str, str]:
+        """Return the system message for a mode, built once and reused across turns."""
+        sys_msg = self._sys_msg_cache.get(mode_key)
+        if sys_msg is None:
+            prompt = self.system_prompts.get(mode_key, DEFAULT_SYSTEM_PROMPTS["chat"])
+            sys_msg = self._sys_msg_cache[mode_key] = {"role": "system", "content": prompt}
+        return sys_msg
+
+    def _needs_wiki(self, query: str) -> bool:
+        """Cheap gate: skip Wikipedia for greetings, acknowledgements, and near-empty input."""
+        q = query.strip().lower().strip("!?.,;: ")
+        return len(q) >= 2 and q not in _GREETINGS
+
+    def _append_message(self, role: str, content: str) -> None:
+        """Append message to history; the deques evict the oldest past memory_size."""
+        self._roles.append(_ROLE_CODES[role])
+        self._contents.append(content)
+
+    def _iter_messages(self, start: int = 0) -> Iterator[Dict[str, str]]:
+        """Materialize history from index ``start`` as API-style message dicts."""
+        for r, c in islice(zip(self._roles, self._contents), start, None):
+            yield {"role": _ROLE_NAMES[r], "content": c}
+
+    def _maybe_summarize(self) -> None:
+        """Start folding turns older than the verbatim window into the running summary.
+
+        Runs only once twice the window has accumulated, so the extra model
+        call is amortized over several turns rather than made on every reply.
+        The call runs on _SUMMARY_POOL; the result is applied at the start of
+        the next turn by _apply_pending_summary.
+        """
+        if self.summary_window <= 0 or self._ensure_client() is None or self._pending_summary is not None:
+            return
+        # Trigger before the next turn would overflow memory_size and evict unsummarized history
+        threshold = max(0, min(2 * self.summary_window, self.memory_size - 2))
+        if len(self._contents) <= threshold:
+            return
+
+        keep = max(0, min(self.summary_window, threshold // 2))
+        keep -= keep % 2  # keep whole user/assistant pairs
+        n_older = min(len(self._contents), len(self._contents) - keep)
+        transcript = "\n".join(
+            f"{_ROLE_NAMES[r]}: {c}" for r, c in islice(zip(self._roles, self._contents), n_older)
+        )
+        if self._summary:
+            transcript = f"Earlier summary: {self._summary}\n{transcript}"
+        self._pending_summary = _SUMMARY_POOL.submit(self._summarize, transcript)
+        self._pending_fold = n_older
+
+    def _summarize(self, transcript: str) -> str:
+        """Ask the summary model to condense a transcript (runs on a worker thread)."""
+        resp = self._client.chat.completions.create(
+            model=self.summary_model,
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": transcript},
+            ],
+            temperature=0,
+            max_tokens=160,
+        )
+        return (resp.choices[0].message.content or "").strip()
+
+    def _apply_pending_summary(self) -> None:
+        """Install a finished background summary and drop the messages it covers.
+
+        An unfinished summary is left pending while history still has room for
+        another turn; only when the next turn would evict messages do we wait.
+        """
+        future = self._pending_summary
+        if future is None:
+            return
+        if not future.done() and len(self._contents) + 2 <= self.memory_size:
+            return
+        self._pending_summary = None
+        try:
+            summary = future.result()
+        except Exception as e:
+            LOGGER.warning("Conversation summarization failed: %s", e)
+            return
+
+        self._summary = summary
+        for _ in range(self._pending_fold):
+            self._roles.popleft()
+            self._contents.popleft()
+        LOGGER.debug("Summarized %d older messages", self._pending_fold)
+
+    def _build_model_messages(self, sys_msg: Dict[str, str], tool_context: Optional[str]) -> List[Dict[str, str]]:
+        msgs: List[Dict[str, str]] = [sys_msg]
+        if self._summary:
+            msgs.append({"role": "system", "content": "Conversation summary so far:\n" + self._summary})
         if tool_context:
             msgs.append({
                 "role": "system",
@@ -169,34 +358,52 @@ class ChatEngine:
                     "when used.\n" + tool_context
                 ),
             })
-        msgs.extend(self._messages[-(self.memory_size - len(msgs)):])
+        tail = self.memory_size - len(msgs)
+        msgs.extend(self._iter_messages(max(0, len(self._contents) - tail)))
         return msgs
 
-    def _call_llm(self, messages: List[Dict[str, str]]) -> str:
-        """Call OpenAI API or return fallback response."""
-        if not _HAS_OPENAI or self._client is None:
+    def _call_llm(self, messages: List[Dict[str, str]], cache_key: Optional[str] = None) -> Iterator[str]:
+        """Stream the OpenAI reply as text deltas, or yield a fallback response."""
+        self._llm_ok = False
+        if self._ensure_client() is None:
             LOGGER.error("OpenAI SDK unavailable — returning local fallback.")
-            return self._local_stub(messages)
+            yield self._local_stub()
+            return
 
+        streamed = False
         try:
-            resp = self._client.chat.completions.create(
+            stream = self._client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
                 max_tokens=600,
+                stream=True,
+                extra_body={"prompt_cache_key": cache_key} if cache_key else None,
             )
-            return (resp.choices[0].message.content or "").strip()
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    streamed = True
+                    yield delta
+            self._llm_ok = True
         except Exception as e:
             LOGGER.error("OpenAI API error: %s", e)
-            return self._local_stub(messages)
+            # Keep a partial reply rather than replacing it with the fallback
+            self._llm_ok = streamed
+            if not streamed:
+                yield self._local_stub()
 
-    def _local_stub(self, messages: List[Dict[str, str]]) -> str:
+    def _local_stub(self) -> str:
         """Fallback if OpenAI is unavailable."""
-        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        last_user = self.get_last_user_message()
         return f"[Local fallback] I can't reach the model. Echo: {last_user[:400]}"
 
 # --------------------------- Module Test ------------------------------
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="[%(levelname)s] %(name)s: %(message)s")
+    LOGGER.setLevel(logging.INFO)
     ce = ChatEngine()
     print("Mode: chat ->", ce.respond("Give me two productivity tips.", mode="chat"))
     print("Mode: code ->", ce.respond("How do I reverse a linked list in Python?", mode="code"))
@@ -9,9 +9,16 @@ Usage:
     print(get_summary("Taj Mahal"))
 
 Dependencies:
-    pip install wikipedia
+    pip install wikipedia  (imported lazily on the first lookup)
 """
-import wikipedia
+from functools import lru_cache
+
+
+@lru_cache(maxsize=1024)
+def _cached_summary(query: str, sentences: int) -> str:
+    """Fetch a summary, memoized per (query, sentences). Exceptions are not cached."""
+    import wikipedia
+    return wikipedia.summary(query, sentences=sentences, auto_suggest=True, redirect=True)
 
 
 def get_summary(query: str, sentences: int = 3) -> str:
@@ -28,9 +35,12 @@ def get_summary(query: str, sentences: int = 3) -> str:
     -------
     str
         Wikipedia summary text, or error message if lookup fails.
+        Successful lookups are cached, so repeated queries skip the network.
     """
+    import wikipedia  # deferred: pulls in requests/bs4, only needed in knowledge mode
+
     try:
-        return wikipedia.summary(query, sentences=sentences, auto_suggest=True, redirect=True)
+        return _cached_summary(query.strip().lower(), sentences)
     except wikipedia.DisambiguationError as e:
         return f"The term '{query}' is ambiguous. Possible options include: {', '.join(e.options[:5])}"
     except wikipedia.PageError: